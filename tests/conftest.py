@@ -1,8 +1,15 @@
-import os.path
+import os
+import pathlib
+import tempfile
+import pytest
 
 GCC = None
+GCC_OPT = None
+CCACHE = False
+COMPILE_CACHE = True
 OUTPUT_FILE_PATH = os.path.join(os.path.dirname(__file__), "tests.log")
 OUTPUT_FILE = None
+SHM_DIR = "/dev/shm"
 
 
 def pytest_addoption(parser):
@@ -12,11 +19,64 @@ def pytest_addoption(parser):
         help="GCC executable to use",
         default="gcc",
     )
+    parser.addoption(
+        "--gcc-opt",
+        action="store",
+        help="optimization flag for tests not parametrized on one (e.g -O2 for a sanity run)",
+        default="-O0",
+    )
+    parser.addoption(
+        "--no-compile-cache",
+        action="store_false",
+        dest="compile_cache",
+        help="don't cache compiled test programs between sessions",
+    )
+    parser.addoption(
+        "--ccache",
+        action="store_true",
+        help="compile test programs through ccache, if it's installed",
+    )
 
 
 def pytest_configure(config):
-    global GCC, OUTPUT_FILE
+    global GCC, GCC_OPT, CCACHE, COMPILE_CACHE, OUTPUT_FILE
     GCC = config.option.gcc
-    print("Using GCC {} in tests".format(GCC))
-    print("Output is saved to {}".format(OUTPUT_FILE_PATH))
-    OUTPUT_FILE = open(OUTPUT_FILE_PATH, "w")
+    GCC_OPT = config.option.gcc_opt
+    CCACHE = config.option.ccache
+    COMPILE_CACHE = config.option.compile_cache
+    flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC
+    if "PYTEST_XDIST_WORKER" not in os.environ:
+        print("Using GCC {} in tests".format(GCC))
+        print("Output is saved to {}".format(OUTPUT_FILE_PATH))
+        # the controller (or a serial run) starts a fresh log, xdist workers append to it.
+        flags |= os.O_TRUNC
+    # unbuffered: each test's block is a single write(), which O_APPEND keeps from interleaving
+    # with other workers' blocks.
+    OUTPUT_FILE = os.fdopen(os.open(OUTPUT_FILE_PATH, flags, 0o644), "wb", buffering=0)
+
+
+def pytest_unconfigure(config):
+    if OUTPUT_FILE is not None:
+        OUTPUT_FILE.close()
+
+
+def _shm_usable():
+    # the testers are executed from the workdir, so a noexec mount won't do.
+    try:
+        st = os.statvfs(SHM_DIR)
+    except OSError:
+        return False
+    return not st.f_flag & os.ST_NOEXEC and os.access(SHM_DIR, os.W_OK | os.X_OK)
+
+
+@pytest.fixture(scope="session")
+def workdir(tmp_path_factory):
+    """
+    build artifacts are written once and thrown away, keep them in RAM if possible.
+    """
+    if not _shm_usable():
+        yield tmp_path_factory.mktemp("ai")
+        return
+
+    with tempfile.TemporaryDirectory(prefix="ai", dir=SHM_DIR) as d:
+        yield pathlib.Path(d)
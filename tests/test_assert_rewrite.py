@@ -1,67 +1,401 @@
 import os.path
 import subprocess
-import shutil
 import signal
-from tempfile import NamedTemporaryFile, mkdtemp
+import hashlib
+import functools
+import fcntl
+import json
+import contextlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import mkstemp
 import re
 from termcolor import colored, RESET
 import pytest
 
-from conftest import GCC, OUTPUT_FILE
+from conftest import GCC, GCC_OPT, CCACHE, COMPILE_CACHE, OUTPUT_FILE
 
 
 ASSERT_INTROSPECT_SO = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "assert_introspect.so"))
 
-HEADERS = "#include <assert.h>\n#include <stdio.h>\n#include <stdlib.h>\n"
+PLUGIN_ARG = "-fplugin={}".format(ASSERT_INTROSPECT_SO)
+# no -pipe: the plugin prints its banner to cc1's stdout, which -pipe feeds to the assembler.
+GCC_ARGV = [GCC, PLUGIN_ARG]
+
+# the rewritten asserts end up in code built with -Werror, so they must compile without warnings
+# (-O2 / -O3 enable more of them, e.g -Wmaybe-uninitialized on the generated buffers).
+# testers run only until their assert fails: no unwind info, and a small, eagerly bound executable.
+TESTER_CC_ARGV = GCC_ARGV + ["-Werror", "-Wall", "-fno-asynchronous-unwind-tables", "-fno-plt"]
+TESTER_LD_ARGV = [GCC, "-s", "-Wl,--hash-style=gnu", "-Wl,-z,now"]
+
+# fds opened by Python are non-inheritable anyway, so skip closing all the others on each spawn.
+# this also lets subprocess use posix_spawn() where it can.
+SPAWN_KWARGS = dict(close_fds=False, stdin=subprocess.DEVNULL)
+# GCC's diagnostics are only searched and shown, so decode them right away. not ascii: in a UTF-8
+# locale GCC quotes names with ‘’.
+STDERR_KWARGS = dict(stderr=subprocess.PIPE, encoding="utf-8", errors="replace")
+
+# testers get these through a precompiled header (see build_pch()), so their sources needn't
+# include any of them.
+SYSTEM_HEADERS = "#include <assert.h>\n#include <stdio.h>\n#include <stdlib.h>\n#include <string.h>\n"
+
+ANSI_ESCAPE_STR = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])', re.ASCII)
+# colors are baked into the rewritten asserts at compile time, so they can't be turned off when
+# running the tester; strip them from the raw output instead.
+ANSI_ESCAPE_BYTES = re.compile(ANSI_ESCAPE_STR.pattern.encode())
+
+PLUGIN_ERROR = re.compile(r"error: assert_introspect: previous error in expression, not rewriting assert")
+
+# the XDG spec says to ignore an empty or relative $XDG_CACHE_HOME.
+_XDG_CACHE_HOME = os.environ.get("XDG_CACHE_HOME", "")
+COMPILE_CACHE_DIR = os.path.join(_XDG_CACHE_HOME if os.path.isabs(_XDG_CACHE_HOME) else os.path.expanduser("~/.cache"),
+                                 "assert_introspect_tests")
+# executables of the most recently used builds that are kept, older ones are removed.
+COMPILE_CACHE_ENTRIES = 24
 
-ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+# with --ccache, tester objects are compiled through ccache: COMPILE_CACHE_DIR holds whole executables,
+# so a change in one tester rebuilds all of them, ccache then reuses the objects of all others.
+CCACHE_EXE = shutil.which("ccache") if CCACHE else None
 
 
-def run_tester(opt_level, test_prototype, test_code, calling_code, *, extra_test="",
-               skip_first=True, strip_colors=True, compile_error=False):
-    with NamedTemporaryFile("w", suffix=".c") as test, \
-         NamedTemporaryFile("w", suffix=".c") as caller, \
-         NamedTemporaryFile(suffix=".o") as obj:
+@functools.lru_cache(maxsize=None)
+def plugin_hash():
+    """
+    hash of the plugin's contents, so any rebuilt plugin (and only a changed one) invalidates
+    the cache.
+    """
+    with open(ASSERT_INTROSPECT_SO, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def toolchain_hash(opt):
+    """
+    hash of what testers are built with besides their sources: the GCC binary and version, and
+    the system headers as preprocessed with opt (so e.g a libc upgrade invalidates the cache).
+    """
+    gcc_path = os.path.realpath(shutil.which(GCC) or GCC)
+    version = subprocess.run([GCC, "-dumpfullversion", "-dumpmachine"], check=True,
+                             stdout=subprocess.PIPE, **SPAWN_KWARGS).stdout
+    headers = subprocess.run([GCC, opt, "-E", "-x", "c", "-"], input=SYSTEM_HEADERS.encode(), check=True,
+                             stdout=subprocess.PIPE, close_fds=False).stdout
+    return cache_key(gcc_path, version, headers)
+
+
+def cache_key(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def cache_get(key):
+    """
+    returns the artifact cached under key, or None on a cache miss.
+    """
+    path = os.path.join(COMPILE_CACHE_DIR, key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    # mtime is the entry's last use, see cache_prune().
+    with contextlib.suppress(OSError):
+        os.utime(path)
+    return data
+
+
+def cache_put(key, data):
+    """
+    stores data in the cache under key. the entry is written aside and moved into place,
+    so concurrent readers never see a partial file.
+    """
+    os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+    fd, tmp = mkstemp(dir=COMPILE_CACHE_DIR)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(COMPILE_CACHE_DIR, key))
+
+
+def cache_prune():
+    """
+    removes all but the COMPILE_CACHE_ENTRIES most recently used executables (with their
+    .failures). must be called with cache_lock() held.
+    """
+    with os.scandir(COMPILE_CACHE_DIR) as it:
+        exes = [e for e in it if e.is_file() and len(e.name) == 64 and "." not in e.name]
+    exes.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for e in exes[COMPILE_CACHE_ENTRIES:]:
+        for path in (e.path, e.path + ".failures"):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
 
-        test.write(HEADERS + extra_test + "{0} {{ {1} }}".format(test_prototype, test_code))
-        test.flush()
-        extra_opts = ["-Werror", "-Wall", ] + ([opt_level] if opt_level else [])
+@contextlib.contextmanager
+def cache_lock():
+    """
+    all xdist workers need the same executables: one builds while the others wait for the cache.
+    a single lock for the whole cache, each build uses all cores anyway.
+    yields whether the cache can be used: with --no-compile-cache, or if COMPILE_CACHE_DIR can't be
+    written (e.g a read-only $HOME), testers are built without it.
+    """
+    lock = None
+    if COMPILE_CACHE:
         try:
-            output = subprocess.check_output([GCC,
-                                             "-fplugin={}".format(ASSERT_INTROSPECT_SO),
-                                             "-c", test.name, "-o", obj.name] + extra_opts,
-                                             stderr=subprocess.PIPE)
-            assert not compile_error, "compilation should have failed!\n"
-        except subprocess.CalledProcessError as e:
-            assert compile_error, "compilation failed unexpectedly!\n" + e.stderr.decode()
-            return e.stderr.decode()
+            os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+            lock = open(os.path.join(COMPILE_CACHE_DIR, "lock"), "w")
+        except OSError:
+            pass
+    if lock is None:
+        yield False
+        return
+
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield True
+
+
+# name of test function -> C sources of its tester, see c_tester().
+TESTERS = {}
+
+
+def c_tester(test_prototype, test_code, calling_code, *, extra_test=""):
+    """
+    registers the C sources of the decorated test's tester.
+    all testers are compiled (each in its own source) into a single executable, which runs the
+    tester named by argv[1]. test functions are renamed per tester, but other functions defined
+    in extra_test must be static so they don't collide.
+    """
+    def decorator(f):
+        TESTERS[f.__name__] = (test_prototype, test_code, calling_code, extra_test)
+        return f
+    return decorator
+
+
+def build_pch(workdir, opt):
+    """
+    precompiles SYSTEM_HEADERS as headers.h, returns its path to -include in each source.
+    GCC ignores a PCH built with a different optimization level, so there's one per opt.
+    with --ccache the header is left as is: ccache hashes the PCH, and GCC doesn't produce the
+    same PCH twice, so each new one would miss the whole ccache.
+    """
+    pch_dir = workdir / "pch{}".format(opt)
+    pch_dir.mkdir(exist_ok=True)
+    header = pch_dir / "headers.h"
+    header.write_bytes(SYSTEM_HEADERS.encode())
+    if not CCACHE_EXE:
+        subprocess.run(TESTER_CC_ARGV + [opt, "-x", "c-header", str(header), "-o", str(header) + ".gch"],
+                       check=True, stdout=subprocess.DEVNULL, **STDERR_KWARGS, **SPAWN_KWARGS)
+    return str(header)
+
+
+def ccache_env(workdir):
+    """
+    environment for compiling in workdir through ccache.
+    """
+    env = dict(os.environ)
+    env.setdefault("CCACHE_DIR", os.path.join(COMPILE_CACHE_DIR, "ccache"))
+    env.update(
+        # workdir is a new temporary directory each session, hash paths relative to it.
+        CCACHE_BASEDIR=str(workdir),
+        # headers.h is written right before the testers are compiled (see build_pch()).
+        CCACHE_SLOPPINESS="include_file_mtime,include_file_ctime",
+        # GCC's output depends on the plugin's contents, not just its path.
+        CCACHE_EXTRAFILES=ASSERT_INTROSPECT_SO,
+    )
+    return env
+
+
+def main_source(names):
+    """
+    source of the testers' main(), which runs the tester named by argv[1].
+    """
+    source = ""
+    dispatch = ""
+    for name in names:
+        test_prototype, _, calling_code, _ = TESTERS[name]
+        source += (f"#define test {name}\n{test_prototype};\n"
+                   f"static void run_{name}(void) {{ {calling_code}; }}\n#undef test\n")
+        dispatch += f'    if (!strcmp(argv[1], "{name}")) {{ run_{name}(); return 0; }}\n'
+    return source + ("int main(int argc, char **argv) {\n    setlinebuf(stdout);\n"
+                     f"    if (argc != 2) return 2;\n{dispatch}    return 2;\n}}\n")
+
+
+def build_testers(workdir, opt):
+    """
+    builds the executable of all registered testers, returns its path and the testers that
+    failed to compile (name -> GCC's stderr). those are left out of the executable, so one
+    broken tester fails only its own test.
+    """
+    sources = {}
+    for name, (test_prototype, test_code, _, extra_test) in sorted(TESTERS.items()):
+        sources[name] = f"{extra_test}\n#define test {name}\n{test_prototype} {{ {test_code} }}"
+
+    output_file = str(workdir / "testers{}".format(opt))
+    exe_key = cache_key(*TESTER_CC_ARGV, *TESTER_LD_ARGV, opt, toolchain_hash(opt), plugin_hash(),
+                        *(part for name, source in sorted(sources.items()) for part in (name, source)),
+                        # main.c is generated after compiling, but it only leaves out failed testers.
+                        main_source(sorted(TESTERS)))
+    with cache_lock() as use_cache:
+        exe_data = cache_get(exe_key) if use_cache else None
+        if exe_data is None:
+            header = build_pch(workdir, opt)
+            launcher, env = ([CCACHE_EXE], ccache_env(workdir)) if CCACHE_EXE else ([], None)
+
+            def compile_objs(names):
+                """
+                compiles the sources of names, returns those that failed (name -> stderr).
+                """
+                try:
+                    subprocess.run(launcher + TESTER_CC_ARGV + [opt, "-include", header, "-c"] +
+                                   [str(workdir / "{}.c".format(name)) for name in names],
+                                   cwd=str(workdir), env=env, check=True, stdout=subprocess.DEVNULL,
+                                   **STDERR_KWARGS, **SPAWN_KWARGS)
+                except subprocess.CalledProcessError as e:
+                    if len(names) == 1:
+                        return {names[0]: e.stderr}
+                    # rebuild each source of the chunk on its own, to tell which of them failed.
+                    return {name: stderr for single in names for name, stderr in compile_objs([single]).items()}
+                return {}
+
+            for name, source in sources.items():
+                (workdir / "{}.c".format(name)).write_bytes(source.encode())
+            # a single driver compiles its sources one after the other, so split them between
+            # parallel drivers and link once. the plugin's banners are checked once in _plugin_loads.
+            jobs = min(len(sources), os.cpu_count() or 1)
+            if CCACHE_EXE:
+                # ccache only caches compilations of a single source.
+                chunks = [[name] for name in sources]
+            else:
+                chunks = [list(sources)[i::jobs] for i in range(jobs)]
+            failures = {}
+            with ThreadPoolExecutor(jobs) as pool:
+                for chunk_failures in pool.map(compile_objs, chunks):
+                    failures.update(chunk_failures)
+
+            names = [name for name in sources if name not in failures]
+            (workdir / "main.c").write_bytes(main_source(names).encode())
+            # main() has no asserts for the plugin to rewrite, if it fails everything is broken anyway.
+            subprocess.run(launcher + TESTER_CC_ARGV + [opt, "-include", header, "-c", "main.c"],
+                           cwd=str(workdir), env=env, check=True, stdout=subprocess.DEVNULL,
+                           **STDERR_KWARGS, **SPAWN_KWARGS)
+            objs = [str(workdir / "{}.o".format(name)) for name in names + ["main"]]
+            subprocess.run(TESTER_LD_ARGV + ["-o", output_file] + objs, check=True,
+                           stdout=subprocess.DEVNULL, **STDERR_KWARGS, **SPAWN_KWARGS)
+            if use_cache:
+                # the testers are built, failing to cache them (e.g a full disk) doesn't fail the tests.
+                with contextlib.suppress(OSError):
+                    # failures first: whoever sees the executable in the cache must see them as well.
+                    cache_put(exe_key + ".failures", json.dumps(failures).encode())
+                    with open(output_file, "rb") as f:
+                        cache_put(exe_key, f.read())
+                    cache_prune()
         else:
-            lines = output.decode().splitlines()
-            assert len(lines) == 1 and lines[0].startswith("assert_introspect loaded"), output
+            failures = json.loads(cache_get(exe_key + ".failures") or b"{}")
+            with open(output_file, "wb") as f:
+                f.write(exe_data)
+            os.chmod(output_file, 0o755)
 
-        caller.write(HEADERS + "{0}; int main(void) {{ setlinebuf(stdout); {1}; return 0; }}"
-            .format(test_prototype, calling_code))
-        caller.flush()
-        output_dir = mkdtemp()
-        try:
-            output_file = os.path.join(output_dir, "out")
+    return output_file, failures
+
+
+def spawn_capture(argv):
+    """
+    runs argv with stdin from /dev/null, returns its stdout and its returncode (as subprocess
+    reports it: -signum if it was killed by a signal).
+    cheaper than subprocess for the many short runs of the testers.
+    """
+    r, w = os.pipe()
+    try:
+        pid = os.posix_spawn(argv[0], argv, os.environ, file_actions=[
+            (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+            (os.POSIX_SPAWN_DUP2, w, 1),
+        ])
+    except BaseException:
+        os.close(r)
+        raise
+    finally:
+        os.close(w)
+
+    with open(r, "rb") as f:
+        output = f.read()
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        return output, -os.WTERMSIG(status)
+    return output, os.WEXITSTATUS(status)
 
-            subprocess.check_call([GCC, "-o", output_file, obj.name, caller.name])
-            with pytest.raises(subprocess.CalledProcessError) as e:
-                subprocess.check_output([output_file])
 
-            output = e.value.output.decode()
-            assert e.value.returncode == -signal.SIGABRT.value, "output: " + output
+def _run_tester(executable, name, *, skip_first=True, strip_colors=True):
+    output, returncode = spawn_capture([executable, name])
+    assert returncode == -signal.SIGABRT.value, "output: " + output.decode("utf-8", "replace")
 
-            OUTPUT_FILE.write(output + "------------\n")
+    if OUTPUT_FILE is not None:
+        OUTPUT_FILE.write(output + b"------------\n")
 
-            if strip_colors:
-                output = ANSI_ESCAPE.sub("", output)
+    # a substring search is much cheaper than the regex, skip it for output without escapes.
+    if strip_colors and b"\x1b" in output:
+        output = ANSI_ESCAPE_BYTES.sub(b"", output)
 
-            return output.splitlines()[1 if skip_first else 0:]
-        finally:
-            shutil.rmtree(output_dir)
+    return output.decode("utf-8", "replace").splitlines()[1 if skip_first else 0:]
+
+
+def _compile_tester(opt, test_prototype, test_code, *, extra_test=""):
+    """
+    compiles a tester which is expected to fail compilation, returns GCC's stderr.
+    """
+    source = f"{SYSTEM_HEADERS}{extra_test}{test_prototype} {{ {test_code} }}"
+    # the plugin runs on PLUGIN_PRE_GENERICIZE, in the front end, so no need to generate code.
+    try:
+        subprocess.run(GCC_ARGV + [opt, "-x", "c", "-fsyntax-only", "-"], input=source,
+                       check=True, stdout=subprocess.DEVNULL, **STDERR_KWARGS, close_fds=False)
+    except subprocess.CalledProcessError as e:
+        return e.stderr
+    assert False, "compilation should have failed!\n"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _plugin_loads():
+    """
+    makes sure GCC loads the plugin, once per session - tester builds discard its stdout.
+    """
+    output = subprocess.run(GCC_ARGV + ["-x", "c", "-c", "-", "-o", os.devnull], input=b"int stub;\n",
+                            check=True, stdout=subprocess.PIPE, close_fds=False).stdout
+    assert output.startswith(b"assert_introspect loaded") and output.count(b"\n") == 1, output
+
+
+@pytest.fixture(scope="session")
+def tester_executable(workdir):
+    builds = {}
+
+    def get(opt):
+        if opt not in builds:
+            try:
+                builds[opt] = build_testers(workdir, opt)
+            except subprocess.CalledProcessError as e:
+                # don't retry the whole build for each test.
+                builds[opt] = e
+        if isinstance(builds[opt], subprocess.CalledProcessError):
+            pytest.fail("compilation failed unexpectedly!\n" + builds[opt].stderr, pytrace=False)
+        return builds[opt]
+
+    return get
+
+
+@pytest.fixture
+def run_tester(request, tester_executable, opt_level):
+    name = request.function.__name__
+    assert name in TESTERS, "test is missing its @c_tester"
+    executable, failures = tester_executable(opt_level or GCC_OPT)
+    if name in failures:
+        pytest.fail("compilation failed unexpectedly!\n" + failures[name], pytrace=False)
+    return functools.partial(_run_tester, executable, name)
+
+
+@pytest.fixture
+def compile_tester(opt_level):
+    return functools.partial(_compile_tester, opt_level or GCC_OPT)
 
 
 @pytest.fixture(params=[None, "-O2", "-O3"])
@@ -70,21 +404,24 @@ def opt_level(request):
 
 
 # short names so colored expressions don't get too long.
-br = lambda s: colored(s, "red", attrs=["bold"])
-bb = lambda s: colored(s, "blue", attrs=["bold"])
-bg = lambda s: colored(s, "green", attrs=["bold"])
-bgr = lambda s: bg(s)[:-len(RESET)]
-by = lambda s: colored(s, "yellow", attrs=["bold"])
-byr = lambda s: by(s)[:-len(RESET)]
-bm = lambda s: colored(s, "magenta", attrs=["bold"])
-bmr = lambda s: bm(s)[:-len(RESET)]
-bc = lambda s: colored(s, "cyan", attrs=["bold"])
-bcr = lambda s: bc(s)[:-len(RESET)]
-dr = lambda s: colored(s, "red", attrs=["dark"])
-
-
-def test_sanity(opt_level):
-    out = run_tester(opt_level, "void test(int n)", "assert(n == 5);", "test(3);")
+# each is called with the same few literals in every (parametrized) run, so they're memoized.
+_memoize = functools.lru_cache(maxsize=None)
+br = _memoize(lambda s: colored(s, "red", attrs=["bold"]))
+bb = _memoize(lambda s: colored(s, "blue", attrs=["bold"]))
+bg = _memoize(lambda s: colored(s, "green", attrs=["bold"]))
+bgr = _memoize(lambda s: bg(s)[:-len(RESET)])
+by = _memoize(lambda s: colored(s, "yellow", attrs=["bold"]))
+byr = _memoize(lambda s: by(s)[:-len(RESET)])
+bm = _memoize(lambda s: colored(s, "magenta", attrs=["bold"]))
+bmr = _memoize(lambda s: bm(s)[:-len(RESET)])
+bc = _memoize(lambda s: colored(s, "cyan", attrs=["bold"]))
+bcr = _memoize(lambda s: bc(s)[:-len(RESET)])
+dr = _memoize(lambda s: colored(s, "red", attrs=["dark"]))
+
+
+@c_tester("void test(int n)", "assert(n == 5);", "test(3);")
+def test_sanity(run_tester):
+    out = run_tester()
     assert out == [
         "> assert(n == 5)",
         "A assert(n == 5)",
@@ -94,7 +431,8 @@ def test_sanity(opt_level):
     ]
 
 
-def test_logical_and_expression_right_repr(opt_level):
+@c_tester("void test(int n, int m)", 'assert(n == 42 && m == 7);', 'test(42, 6);')
+def test_logical_and_expression_right_repr(run_tester):
     """
     if the left side of an AND expression passed but the right side failed, only
     the right side is shown.
@@ -102,8 +440,7 @@ def test_logical_and_expression_right_repr(opt_level):
 
     variables of the left side are not shown, as well!
     """
-    out = run_tester(opt_level, "void test(int n, int m)", 'assert(n == 42 && m == 7);',
-                     'test(42, 6);')
+    out = run_tester()
     assert out == [
         "> assert(n == 42 && m == 7)",
         "A assert((n == 42) && (m == 7))",
@@ -113,12 +450,12 @@ def test_logical_and_expression_right_repr(opt_level):
     ]
 
 
-def test_logical_or_expression_repr_both(opt_level):
+@c_tester("void test(int n, int m)", 'assert(n == 43 || m == 7);', 'test(42, 6);')
+def test_logical_or_expression_repr_both(run_tester):
     """
     if both sides of an OR expression fail, both are printed (different logic from AND)
     """
-    out = run_tester(opt_level, "void test(int n, int m)", 'assert(n == 43 || m == 7);',
-                     'test(42, 6);')
+    out = run_tester()
     assert out == [
         "> assert(n == 43 || m == 7)",
         "A assert((n == 43) || (m == 7))",
@@ -129,17 +466,18 @@ def test_logical_or_expression_repr_both(opt_level):
     ]
 
 
-def test_subexpression_function_call_repr(opt_level):
+@c_tester("void test(int n)", "assert(f2(f1(f0()), n) == 5);", "test(20);",
+          extra_test="static int f2(int m, int n) { return m + n; }\n"
+                     "static int f1(int n) { return n - 1; }\n"
+                     "static int f0(void) { return 5; }")
+def test_subexpression_function_call_repr(run_tester):
     """
     tests the generated function call repr.
     1. functions with 0, 1, 2 arguments
     2. function calls inside function calls
     3. subexpressions are displayed in their evaluation order.
     """
-    out = run_tester(opt_level, "void test(int n)", "assert(f2(f1(f0()), n) == 5);", "test(20);",
-                     extra_test="int f2(int m, int n) { return m + n; }\n"
-                                "int f1(int n) { return n - 1; }\n"
-                                "int f0(void) { return 5; }", strip_colors=False)
+    out = run_tester(strip_colors=False)
     assert out == [
         "> assert(f2(f1(f0()), n) == 5)",
         f"{bb('A')} assert({bgr('f2(') + byr('f1(') + bm('f0()') + by(')') + bgr(', ') + bc('n') + bg(')')} == 5)",
@@ -154,14 +492,14 @@ def test_subexpression_function_call_repr(opt_level):
     ]
 
 
-def test_subexpression_string_repr(opt_level):
+@c_tester("void test(const char *s)", 'assert(strstr("hello world", s) == NULL);', 'test("world");')
+def test_subexpression_string_repr(run_tester):
     """
     tests "string pointers" are identified and their repr use %s.
     also tests that NULL is *not* identified as a string pointer, but is identified
     as NULL in the AST-rebuilt expression.
     """
-    out = run_tester(opt_level, "void test(const char *s)", 'assert(strstr("hello world", s) == NULL);',
-                     'test("world");', extra_test="#include <string.h>\n")
+    out = run_tester()
     assert out == [
         '> assert(strstr("hello world", s) == NULL)',
         'A assert(strstr("hello world", s) == NULL)',
@@ -172,14 +510,8 @@ def test_subexpression_string_repr(opt_level):
     ]
 
 
-def test_subexpression_evaluated_once(opt_level):
-    """
-    tests that subexpressions in the assert are evaluated only once (due to the use of save_expr)
-    even though we show them multiple times (once in the assert repr, and once more in the
-    call_me_once call repr).
-    """
-    extra = """
-    int call_me_once(int n) {
+@c_tester("void test(int n)", 'assert(call_me_once(n) == n);', 'test(3);', extra_test="""
+    static int call_me_once(int n) {
         static int called = 0;
 
         if (called) {
@@ -190,10 +522,14 @@ def test_subexpression_evaluated_once(opt_level):
 
         return n + 1;
     }
+    """)
+def test_subexpression_evaluated_once(run_tester):
     """
-
-    out = run_tester(opt_level, "void test(int n)", 'assert(call_me_once(n) == n);',
-                     'test(3);', extra_test=extra)
+    tests that subexpressions in the assert are evaluated only once (due to the use of save_expr)
+    even though we show them multiple times (once in the assert repr, and once more in the
+    call_me_once call repr).
+    """
+    out = run_tester()
     assert out == [
         "> assert(call_me_once(n) == n)",
         "A assert(call_me_once(n) == n)",
@@ -204,7 +540,13 @@ def test_subexpression_evaluated_once(opt_level):
     ]
 
 
-def test_subexpression_not_evaluated(opt_level):
+@c_tester("void test(int n)", 'assert(n == 5 && dont_call_me(n) == n);', 'test(42);', extra_test="""
+    static int dont_call_me(int n) {
+        printf("dont_call_me was evaluated!\\n");
+        exit(1); // will fail the SIGABRT assert in pytest
+    }
+    """)
+def test_subexpression_not_evaluated(run_tester):
     """
     tests that a subexpression not evaluated by the original condition, will not be evaluated
     when we repr it.
@@ -212,15 +554,7 @@ def test_subexpression_not_evaluated(opt_level):
     this actually expands what test_and_expression_short_circut tests.
     """
 
-    extra = """
-    int dont_call_me(int n) {
-        printf("dont_call_me was evaluated!\\n");
-        exit(1); // will fail the SIGABRT assert in pytest
-    }
-    """
-
-    out = run_tester(opt_level, "void test(int n)", 'assert(n == 5 && dont_call_me(n) == n);',
-                     'test(42);', extra_test=extra)
+    out = run_tester()
     assert out == [
         "> assert(n == 5 && dont_call_me(n) == n)",
         "A assert((n == 5) && (dont_call_me(n) == n))",
@@ -230,7 +564,13 @@ def test_subexpression_not_evaluated(opt_level):
     ]
 
 
-def test_subexpression_colors(opt_level):
+@c_tester("void test(int n)", 'assert(n == 5 || (short)n == 6 || func5(n) == n || func5(n + func5(9)) == 12);',
+          'test(42);', extra_test="""
+    static int func5(int n) {
+        return 7;
+    }
+    """)
+def test_subexpression_colors(run_tester):
     """
     tests color assigning to subexpressions:
     1. variables get colors
@@ -243,14 +583,7 @@ def test_subexpression_colors(opt_level):
     also tests the colorizing of A and E.
     also tests AST casts.
     """
-    extra = """
-    int func5(int n) {
-        return 7;
-    }
-    """
-
-    out = run_tester(opt_level, "void test(int n)", 'assert(n == 5 || (short)n == 6 || func5(n) == n || func5(n + func5(9)) == 12);',
-                     'test(42);', extra_test=extra, strip_colors=False)
+    out = run_tester(strip_colors=False)
 
     assert out == [
         "> assert(n == 5 || (short)n == 6 || func5(n) == n || func5(n + func5(9)) == 12)",
@@ -269,7 +602,8 @@ def test_subexpression_colors(opt_level):
     ]
 
 
-def test_ast_double_cast(opt_level):
+@c_tester("void test(int n)", 'short x = n; assert(x + 5 == (short)n);', 'test(5);')
+def test_ast_double_cast(run_tester):
     """
     further tests that casts are displayed in the AST repr and also displayed in variable
     subexpressions, makes sure "double casts" (cast then promote) are displayed:
@@ -278,7 +612,7 @@ def test_ast_double_cast(opt_level):
     "(int)x + 5 == (int)(short int)n".
     """
 
-    out = run_tester(opt_level, "void test(int n)", 'short x = n; assert(x + 5 == (short)n);', 'test(5);')
+    out = run_tester()
     assert out == [
         "> assert(x + 5 == (short)n)",
         # double cast
@@ -290,16 +624,17 @@ def test_ast_double_cast(opt_level):
     ]
 
 
-def test_error_in_expression(opt_level):
+def test_error_in_expression(compile_tester):
     """
     if there's an error inside the assert expression, the plugin should identify it and refuse to
     rewrite.
     """
-    out = run_tester(opt_level, "void test(int n)", 'assert(n == m);', 'test(5);', compile_error=True)
-    assert "error: assert_introspect: previous error in expression, not rewriting assert" in out
+    out = compile_tester("void test(int n)", 'assert(n == m);')
+    assert PLUGIN_ERROR.search(out), out
 
 
-def test_binary_expression_casts_skipped(opt_level):
+@c_tester("void test(int n)", 'unsigned long x = n; assert(x + 8 == n + 2);', 'test(5);')
+def test_binary_expression_casts_skipped(run_tester):
     """
     tests that casts on binary expressions are bypassed. for example:
 
@@ -310,7 +645,7 @@ def test_binary_expression_casts_skipped(opt_level):
     in this case, the PLUS_EXR 'x + y' is wrapped in a NOP_EXPR to cast it to "long unsigned int".
     make sure the plugin identifies it and sees ahead.
     """
-    out = run_tester(opt_level, "void test(int n)", 'unsigned long x = n; assert(x + 8 == n + 2);', 'test(5);')
+    out = run_tester()
     assert out == [
         "> assert(x + 8 == n + 2)",
         "A assert(x + 8 == n + 2)",
@@ -321,12 +656,13 @@ def test_binary_expression_casts_skipped(opt_level):
     ]
 
 
-def test_ast_repr_addressof(opt_level):
+@c_tester("void test(int n)", 'assert(!func5(&n));', 'test(5);',
+          extra_test="static int func5(int *n) { return *n + 5; }")
+def test_ast_repr_addressof(run_tester):
     """
     tests the printing of &variable
     """
-    out = run_tester(opt_level, "void test(int n)", 'assert(!func5(&n));', 'test(5);',
-                     extra_test="int func5(int *n) { return *n + 5; }", strip_colors=False)
+    out = run_tester(strip_colors=False)
     assert out[:-1] == [
         "> assert(!func5(&n))",
         f"{bb('A')} assert({bg('func5(&n)')} == 0)",
@@ -334,16 +670,16 @@ def test_ast_repr_addressof(opt_level):
         "> subexpressions:",
     ]
     # it's a real hassle to test a regex with colors
-    assert re.match(r"  func5\(0x[a-f0-9]+\) = 10", ANSI_ESCAPE.sub("", out[-1]))
+    assert re.match(r"  func5\(0x[a-f0-9]+\) = 10", ANSI_ESCAPE_STR.sub("", out[-1]))
 
 
-def test_subexpression_var_not_evaluated(opt_level):
+@c_tester("void test(int n, int m)", 'assert(n == 41 && m == 6);', 'test(42, 6);')
+def test_subexpression_var_not_evaluated(run_tester):
     """
     variables that are part of an expression not evaluated should not be displayed.
     """
 
-    out = run_tester(opt_level, "void test(int n, int m)", 'assert(n == 41 && m == 6);',
-                     'test(42, 6);')
+    out = run_tester()
     assert out == [
         "> assert(n == 41 && m == 6)",
         "A assert((n == 41) && (m == 6))",
@@ -353,32 +689,17 @@ def test_subexpression_var_not_evaluated(opt_level):
     ]
 
 
-def test_ast_unknown_expr(opt_level):
-    """
-    tests that expressions we don't know how to parse (yet) are printed as "..." in the AST repr, and
-    we don't crash.
-    ultimately I want this test to be empty ^^
-
-    currently:
-    * struct . reference
-    * struct -> reference
-    * array access
-
-    """
-
-    extra = """
+@c_tester("void test(int n)", calling_code='test(6);', extra_test="""
     struct c {
         struct {
             int a;
         } b;
     };
 
-    int func(int n) {
+    static int func(int n) {
         return n + 5;
     }
-    """
-
-    test_code = """
+    """, test_code="""
     struct c c;
     c.b.a = 5;
 
@@ -387,9 +708,21 @@ def test_ast_unknown_expr(opt_level):
     int arr[] = { 5, 5 };
 
     assert(func(c.b.a + n) == 42 || cp->b.a == 12 || arr[1] + 2 == 4 * arr[0]);
+    """)
+def test_ast_unknown_expr(run_tester):
     """
+    tests that expressions we don't know how to parse (yet) are printed as "..." in the AST repr, and
+    we don't crash.
+    ultimately I want this test to be empty ^^
 
-    out = run_tester(opt_level, "void test(int n)", test_code, 'test(6);', extra_test=extra)
+    currently:
+    * struct . reference
+    * struct -> reference
+    * array access
+
+    """
+
+    out = run_tester()
     assert out == [
         "> assert(func(c.b.a + n) == 42 || cp->b.a == 12 || arr[1] + 2 == 4 * arr[0])",
         "A assert(((func(... + n) == 42) || (... == 12)) || (... + 2 == ... * 4))",
@@ -400,7 +733,16 @@ def test_ast_unknown_expr(opt_level):
     ]
 
 
-def test_floating_point_support(opt_level):
+@c_tester("void test(float f)", calling_code='test(6.0f);', extra_test="""
+    static double double_func(float f) {
+        return (double)f + 5.2;
+    }
+    """, test_code="""
+    double d = 5999999999.9999;
+    long double dd = 43.54;
+    assert(double_func((float)d) == (double)f || d == double_func(f) || dd == double_func(f) * 3.5 || dd == double_func(f) / 5.2);
+    """)
+def test_floating_point_support(run_tester):
     """
     tests the plugin handles expressions containing floating point stuff.
     1. float consts
@@ -411,19 +753,7 @@ def test_floating_point_support(opt_level):
     6. AST repr of the above
     """
 
-    extra = """
-    double double_func(float f) {
-        return (double)f + 5.2;
-    }
-    """
-
-    test_code = """
-    double d = 5999999999.9999;
-    long double dd = 43.54;
-    assert(double_func((float)d) == (double)f || d == double_func(f) || dd == double_func(f) * 3.5 || dd == double_func(f) / 5.2);
-    """
-
-    out = run_tester(opt_level, "void test(float f)", test_code, 'test(6.0f);', extra_test=extra)
+    out = run_tester()
     assert out == [
         "> assert(double_func((float)d) == (double)f || d == double_func(f) || dd == double_func(f) * 3.5 || dd == double_func(f) / 5.2)",
         "A assert((((double_func((float)d) == (double)f) || (double_func(f) == d)) || (double_func(f) * 0.000000 == dd)) || (double_func(f) / 0.000000 == dd))",
@@ -441,14 +771,14 @@ def test_floating_point_support(opt_level):
     ]
 
 
-def test_binary_ops(opt_level):
+@c_tester("void test(int n, int m)",
+          "assert(n - 5 == m + 2 || (n ^ 3) == m || (n & m) == 10 || (n | m) == 30);", 'test(42, 12);')
+def test_binary_ops(run_tester):
     """
     tests various binary ops I saw are untested in other tests.
     - | & ^
     """
-    test_code = "assert(n - 5 == m + 2 || (n ^ 3) == m || (n & m) == 10 || (n | m) == 30);"
-
-    out = run_tester(opt_level, "void test(int n, int m)", test_code, 'test(42, 12);')
+    out = run_tester()
     assert out == [
         "> assert(n - 5 == m + 2 || (n ^ 3) == m || (n & m) == 10 || (n | m) == 30)",
         "A assert((((n + -5 == m + 2) || (n ^ 3 == m)) || (n & m == 10)) || (n | m == 30))",